@@ -1,12 +1,17 @@
 import streamlit as st
-import json
+import msgspec
 import time
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 import paho.mqtt.client as mqtt
 from datetime import datetime
+from typing import Optional, Union, get_type_hints
 import queue 
+import io
+import csv
+from collections import deque
+from itertools import islice, repeat
 import uuid 
 import math # Untuk hitung total halaman
 
@@ -16,10 +21,100 @@ import math # Untuk hitung total halaman
 BROKER = "broker.hivemq.com"
 PORT = 1883
 TOPIC = "project/tralalilo_trolia/sensor"
+QUEUE_MAXSIZE = 256 # Batas antrean agar tidak membengkak saat burst
+QUEUE_FULL_WARN_INTERVAL = 60 # Detik, jeda minimum antar peringatan antrean penuh
+REFRESH_INTERVAL = 2 # Detik, interval refresh dashboard live
+SLOW_REFRESH_INTERVAL = 10 # Detik, interval refresh peta & tabel rekaman
 
 DEFAULT_LAT = -6.24951875195404
 DEFAULT_LON = 107.01397007764963
 
+# Zona waktu server, dipakai saat mengonversi timestamp (ns) ke waktu tampilan
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+HISTORY_MAX = 100
+TREND_KEYS = ['co', 'pm25', 'no2']
+
+# Kolom data rekaman, disimpan sebagai numpy record array dengan dtype tetap.
+# Hanya key berikut yang direkam; field lain di payload tidak masuk tabel/CSV.
+SENSOR_KEYS = ['co', 'pm25', 'suhu', 'kelembaban', 'no2', 'pm10', 'so2', 'o3', 'ai_label', 'ai_score']
+RECORD_DTYPE = np.dtype([
+    ('co', 'f8'), ('pm25', 'f8'), ('suhu', 'f8'), ('kelembaban', 'f8'),
+    ('no2', 'f8'), ('pm10', 'f8'), ('so2', 'f8'), ('o3', 'f8'),
+    ('ai_label', 'O'), ('ai_score', 'f8'), ('ts_ns', 'i8') # 'O': label disimpan utuh
+])
+RECORD_CAPACITY = 1024 # Kapasitas awal; digandakan saat penuh
+
+# Metrik parameter udara per tab: (key, label, satuan)
+METRICS_LOKAL = [('co', "CO", "mg/m³"), ('pm25', "PM 2.5", "µg/m³"), ('suhu', "Suhu", "°C"), ('kelembaban', "Kelembapan", "%")]
+METRICS_API = [('no2', "NO₂", "µg/m³"), ('pm10', "PM 10", "µg/m³"), ('so2', "SO₂", "µg/m³"), ('o3', "Ozon", "µg/m³")]
+
+# Warna marker peta per status
+MAP_COLORS = {"BAIK": "green", "SEDANG": "blue", "TIDAK SEHAT": "orange", "BERBAHAYA": "red"}
+STATUS_COLORS = {"BAIK": "green", "SEDANG": "blue", "TIDAK SEHAT": "#FFCC00", "SANGAT TIDAK SEHAT": "orange"}
+# Warna bar gauge per puluhan persen: <50 merah, 50-79 oranye, >=80 hijau
+GAUGE_COLORS = ("red",) * 5 + ("orange",) * 3 + ("green",) * 2
+
+CUSTOM_CSS = """
+    <style>
+    .metric-card {
+        background-color: #f8f9fa;
+        border-radius: 10px;
+        padding: 15px;
+        text-align: center;
+        box-shadow: 2px 2px 5px rgba(0,0,0,0.1);
+    }
+    </style>
+    """
+
+# Nilai sensor: int tetap int (12 -> "12"), float tetap float
+Reading = Optional[Union[int, float]]
+
+# Skema paket sensor; JSON langsung di-decode ke struct bertipe
+class Packet(msgspec.Struct):
+    co: Reading = None
+    pm25: Reading = None
+    suhu: Reading = None
+    kelembaban: Reading = None
+    no2: Reading = None
+    pm10: Reading = None
+    so2: Reading = None
+    o3: Reading = None
+    ai_label: Optional[str] = None
+    ai_score: Optional[float] = None
+    ts_ns: int = 0
+
+    def __post_init__(self):
+        # Fallback seperti data.get("ai_label", "MENUNGGU") / float(data.get("ai_score", 0))
+        if self.ai_label is None:
+            self.ai_label = "MENUNGGU"
+        if self.ai_score is None:
+            self.ai_score = 0.0
+
+# strict=False: angka yang dikirim sebagai string (mis. "0.87") tetap diterima
+packet_decoder = msgspec.json.Decoder(Packet, strict=False)
+PACKET_TYPES = get_type_hints(Packet)
+
+def decode_packet(raw):
+    try:
+        return packet_decoder.decode(raw)
+    except msgspec.ValidationError:
+        # Ada field yang tidak bisa dikonversi (mis. "co": "N/A"): paket tetap
+        # dipakai, hanya field tersebut yang kembali ke nilai default
+        fields = msgspec.json.decode(raw)
+        if not isinstance(fields, dict):
+            raise
+        valid = {}
+        for name, value in fields.items():
+            if name not in PACKET_TYPES:
+                continue
+            try:
+                valid[name] = msgspec.convert(value, PACKET_TYPES[name], strict=False)
+            except msgspec.ValidationError:
+                pass
+        return Packet(**valid)
+
 # =========================
 # SETUP HALAMAN
 # =========================
@@ -31,42 +126,51 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
-    <style>
-    .metric-card {
-        background-color: #f8f9fa;
-        border-radius: 10px;
-        padding: 15px;
-        text-align: center;
-        box-shadow: 2px 2px 5px rgba(0,0,0,0.1);
-    }
-    </style>
-    """, unsafe_allow_html=True)
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # =========================
 # SHARED QUEUE (JEMBATAN DATA)
 # =========================
+# Satu antrean per topik, dibagi ke semua sesi dalam proses ini
 @st.cache_resource
-def get_data_queue():
-    return queue.Queue()
+def get_data_queue(topic):
+    return queue.Queue(maxsize=QUEUE_MAXSIZE)
 
-data_queue = get_data_queue()
+data_queue = get_data_queue(TOPIC)
 
 # =========================
 # SESSION STATE INIT
 # =========================
 if "latest_data" not in st.session_state:
-    st.session_state.latest_data = {}
+    st.session_state.latest_data = None
 if "data_history" not in st.session_state:
-    st.session_state.data_history = []
+    st.session_state.data_history = deque(maxlen=HISTORY_MAX)
+
+# --- STATE UNTUK GRAFIK TREN (UPDATE INKREMENTAL) ---
+# hist_total: jumlah titik yang pernah masuk ke history
+# last_sent_idx: jumlah titik yang sudah ditambahkan ke figure
+if "hist_total" not in st.session_state:
+    st.session_state.hist_total = 0
+if "last_sent_idx" not in st.session_state:
+    st.session_state.last_sent_idx = 0
+# last_ts_ns: ts_ns titik terakhir di history (pengecekan duplikat)
+if "last_ts_ns" not in st.session_state:
+    st.session_state.last_ts_ns = 0
 
 # --- STATE UNTUK PEREKAMAN ---
 if "recording" not in st.session_state:
     st.session_state.recording = False
 if "recording_buffer" not in st.session_state:
-    st.session_state.recording_buffer = []
+    st.session_state.recording_buffer = np.empty(RECORD_CAPACITY, dtype=RECORD_DTYPE)
+if "recording_count" not in st.session_state:
+    st.session_state.recording_count = 0
 if "session_id" not in st.session_state:
     st.session_state.session_id = None
+# recording_csv_key: (session_id, jumlah baris) saat bytes CSV terakhir dibangun
+if "recording_csv" not in st.session_state:
+    st.session_state.recording_csv = None
+if "recording_csv_key" not in st.session_state:
+    st.session_state.recording_csv_key = None
 
 # --- STATE UNTUK PAGINATION TABEL ---
 if "table_page" not in st.session_state:
@@ -78,19 +182,46 @@ if "table_page" not in st.session_state:
 def on_connect(client, userdata, flags, reason_code, properties):
     if reason_code == 0:
         print("✅ Connected to MQTT")
-        client.subscribe(TOPIC)
+        client.subscribe(userdata['topic'])
 
 def on_message(client, userdata, msg):
     try:
-        payload = json.loads(msg.payload.decode())
-        payload['timestamp'] = datetime.now()
-        data_queue.put(payload)
+        payload = decode_packet(msg.payload)
     except Exception as e:
         print("Payload error:", e)
+        return
+    payload.ts_ns = time.time_ns()
 
+    data_queue = userdata['queue']
+    try:
+        data_queue.put_nowait(payload)
+    except queue.Full:
+        # Antrean penuh (tidak ada sesi yang menguras): buang paket tertua,
+        # karena UI hanya membutuhkan data terbaru
+        try:
+            data_queue.get_nowait()
+        except queue.Empty:
+            pass
+        data_queue.put_nowait(payload) # Hanya thread ini yang mengisi antrean
+        userdata['dropped'] += 1
+
+        now = time.monotonic()
+        if now - userdata['last_full_warning'] >= QUEUE_FULL_WARN_INTERVAL:
+            print(f"Message queue is full. Dropped {userdata['dropped']} oldest message(s).")
+            userdata['dropped'] = 0
+            userdata['last_full_warning'] = now
+
+# Satu client MQTT per topik per proses; cache_resource mencegah
+# subscribe ganda ke topik yang sama
 @st.cache_resource
-def start_mqtt_service():
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+def start_mqtt_service(topic):
+    userdata = {
+        'topic': topic,
+        'queue': get_data_queue(topic),
+        'dropped': 0,
+        'last_full_warning': float('-inf')
+    }
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, userdata=userdata)
     client.on_connect = on_connect
     client.on_message = on_message
     
@@ -102,45 +233,154 @@ def start_mqtt_service():
         print(f"Connection Failed: {e}")
     return client
 
-start_mqtt_service()
+start_mqtt_service(TOPIC)
 
 # =========================
 # MAIN THREAD: PROCESS DATA
 # =========================
-while not data_queue.empty():
-    new_data = data_queue.get()
-    st.session_state.latest_data = new_data
+def process_queue():
+    # Tidak ada paket baru: lewati seluruh blok update history/rekaman
+    if data_queue.empty():
+        return
+
+    # Kuras seluruh antrean sekaligus
+    batch = []
+    while True:
+        try:
+            batch.append(data_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    if batch:
+        # Hanya paket terakhir yang relevan untuk tampilan saat ini
+        st.session_state.latest_data = batch[-1]
     
-    # 1. Update History untuk Grafik Live
-    if not st.session_state.data_history or st.session_state.data_history[-1].get('timestamp') != new_data['timestamp']:
-        st.session_state.data_history.append(new_data)
-        if len(st.session_state.data_history) > 100:
-            st.session_state.data_history.pop(0)
+        # 1. Update History untuk Grafik Live
+        last_ts_ns = st.session_state.last_ts_ns
+        fresh = []
+        for new_data in batch:
+            ts_ns = new_data.ts_ns
+            if ts_ns != last_ts_ns:
+                fresh.append(new_data)
+                last_ts_ns = ts_ns
+        st.session_state.data_history.extend(fresh)
+        st.session_state.hist_total += len(fresh)
+        st.session_state.last_ts_ns = last_ts_ns
     
-    # 2. Logika Perekaman (Recording)
-    if st.session_state.recording:
-        record_entry = new_data.copy()
-        record_entry['session_id'] = st.session_state.session_id
-        # Format timestamp agar rapi di tabel
-        record_entry['timestamp'] = record_entry['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-        st.session_state.recording_buffer.append(record_entry)
+        # 2. Logika Perekaman (Recording)
+        if st.session_state.recording:
+            buf = st.session_state.recording_buffer
+            n = st.session_state.recording_count
+            need = n + len(batch)
+            if need > len(buf):
+                # Gandakan kapasitas agar append tetap amortized O(1)
+                grown = np.empty(max(need, 2 * len(buf)), dtype=RECORD_DTYPE)
+                grown[:n] = buf[:n]
+                buf = st.session_state.recording_buffer = grown
+            for key in RECORD_DTYPE.names:
+                buf[key][n:need] = [getattr(new_data, key) for new_data in batch]
+            st.session_state.recording_count = need
+
+# Kuras antrean sebelum sidebar & dashboard dirender (rerun penuh);
+# fragment yang jalan sendiri memanggilnya lagi di awal
+process_queue()
 
 # =========================
 # UI LOGIC
 # =========================
-data = st.session_state.latest_data
+def to_local_time(ts_ns):
+    # Epoch nanodetik (skalar atau array) -> waktu lokal, dikonversi sekaligus
+    return pd.to_datetime(ts_ns, unit='ns', utc=True).tz_convert(LOCAL_TZ).tz_localize(None)
+
+def format_records(df):
+    # Ganti kolom ts_ns dengan timestamp terformat agar rapi di tabel/CSV
+    df = df.rename(columns={'ts_ns': 'timestamp'})
+    df['timestamp'] = to_local_time(df['timestamp'].to_numpy()).strftime(TIME_FORMAT)
+    return df
+
+def recording_len():
+    return st.session_state.recording_count
 
 def get_gauge_color(score_percent):
-    if score_percent >= 80: return "green"
-    elif score_percent >= 50: return "orange"
-    else: return "red"
+    return GAUGE_COLORS[min(max(int(score_percent), 0) // 10, 9)]
+
+def new_trend_figure():
+    fig = go.Figure()
+    for key in TREND_KEYS:
+        fig.add_trace(go.Scattergl(x=[], y=[], mode='lines', name=key))
+    fig.update_layout(
+        title="Tren Polutan",
+        xaxis_title="timestamp",
+        yaxis_title="value",
+        legend_title_text="variable"
+    )
+    return fig
+
+def new_gauge_figure():
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = 0,
+        gauge = {
+            'axis': {'range': [0, 100]},
+            'steps': [{'range': [0, 100], 'color': "#f0f2f6"}],
+            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 70}
+        }
+    ))
+    fig.update_layout(height=300, margin=dict(l=20, r=20, t=50, b=20))
+    return fig
+
+# Peta hanya bergantung pada lokasi & status, jadi cukup dibangun sekali per status;
+# figure tidak pernah diubah setelah dibuat, jadi objeknya sendiri yang di-cache
+@st.cache_resource
+def build_map(lat, lon, status):
+    fig_map = go.Figure(go.Scattermapbox(
+        lat=[lat], lon=[lon], mode='markers', name=status, showlegend=True,
+        marker={'size': 20, 'color': MAP_COLORS.get(status, "#636efa")}
+    ))
+    fig_map.update_layout(
+        mapbox={'style': "open-street-map", 'center': {'lat': lat, 'lon': lon}, 'zoom': 14},
+        legend_title_text="status", height=300, margin={"r":0,"t":0,"l":0,"b":0}
+    )
+    return fig_map
+
+def format_csv_value(value):
+    # Float ditulis apa adanya (12 -> "12", 23.7 -> "23.7"); NaN (data kosong) -> sel kosong
+    if isinstance(value, float):
+        return '' if math.isnan(value) else format(value, '.15g')
+    return value
+
+def build_csv(session_id, n_rows, records):
+    rec = records[:n_rows]
+    timestamps = to_local_time(rec['ts_ns']).strftime(TIME_FORMAT)
+    columns = [[format_csv_value(v) for v in rec[k].tolist()] for k in SENSOR_KEYS]
+    # csv.writer memberi tanda kutip pada nilai yang mengandung koma/kutip/baris baru
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(SENSOR_KEYS + ['timestamp', 'session_id'])
+    writer.writerows(zip(*columns, timestamps, repeat(session_id, n_rows)))
+    return out.getvalue().encode('utf-8')
 
 def get_status_color(label):
-    if label == "BAIK": return "green"
-    if label == "SEDANG": return "blue"
-    if label == "TIDAK SEHAT": return "#FFCC00"
-    if label == "SANGAT TIDAK SEHAT": return "orange"
-    return "red"
+    return STATUS_COLORS.get(label, "red")
+
+def get_recording_csv():
+    # Bytes CSV hanya dibangun ulang bila ada baris baru sejak pembangunan terakhir
+    key = (st.session_state.session_id, recording_len())
+    if st.session_state.recording_csv_key != key:
+        st.session_state.recording_csv = build_csv(
+            st.session_state.session_id,
+            recording_len(),
+            st.session_state.recording_buffer
+        )
+        st.session_state.recording_csv_key = key
+    return st.session_state.recording_csv
+
+# Status rekaman ikut diperbarui tanpa rerun penuh
+@st.fragment(run_every=REFRESH_INTERVAL)
+def recording_panel():
+    process_queue()
+    if st.session_state.recording:
+        st.info(f"Merekam... Data: {recording_len()} baris")
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -156,7 +396,8 @@ with st.sidebar:
     if st.button("▶️ Mulai Rekam", type="primary", disabled=st.session_state.recording):
         st.session_state.recording = True
         st.session_state.session_id = str(uuid.uuid4())[:8]
-        st.session_state.recording_buffer = [] # Reset buffer saat mulai baru
+        st.session_state.recording_buffer = np.empty(RECORD_CAPACITY, dtype=RECORD_DTYPE) # Reset buffer saat mulai baru
+        st.session_state.recording_count = 0
         st.session_state.table_page = 0 # Reset halaman tabel
         st.rerun()
         
@@ -165,155 +406,165 @@ with st.sidebar:
         st.session_state.recording = False
         st.rerun()
     
-    if st.session_state.recording:
-        st.info(f"Merekam... Data: {len(st.session_state.recording_buffer)} baris")
-        
+    recording_panel()
+
     # Tombol Download
-    if st.session_state.recording_buffer:
-        df_rec = pd.DataFrame(st.session_state.recording_buffer)
-        csv = df_rec.to_csv(index=False).encode('utf-8')
+    # Di luar fragment ber-timer: CSV hanya dibangun saat rerun penuh
+    # (klik tombol apa pun, termasuk Download itu sendiri), bukan tiap refresh
+    if recording_len():
+        csv = get_recording_csv()
         st.download_button(
             label="📥 Download CSV",
             data=csv,
             file_name=f"data_rekaman_{st.session_state.session_id}.csv",
             mime="text/csv"
         )
+        if st.session_state.recording:
+            st.caption(f"CSV berisi {recording_len()} baris (sampai interaksi terakhir).")
 
     st.markdown("---")
     if st.button("🗑️ Hapus Grafik Live"):
-        st.session_state.data_history = []
+        st.session_state.data_history.clear()
+        st.session_state.hist_total = 0
+        st.session_state.last_sent_idx = 0
+        st.session_state.last_ts_ns = 0
+        st.session_state.pop("fig_hist", None)
         st.rerun()
 
-# --- HEADER ---
-if not data:
-    st.info("📡 Menunggu data MQTT... (Pastikan alat menyala)")
-    time.sleep(2)
-    st.rerun()
-
-ai_label = data.get("ai_label", "MENUNGGU")
-ai_score = float(data.get("ai_score", 0))
-
-st.title("🌫️ AirQuality Guard Dashboard")
-st.markdown(f"**Lokasi:** {node} | **Update:** {data.get('timestamp').strftime('%H:%M:%S')}")
-
-if ai_label in ["SANGAT TIDAK SEHAT", "BERBAHAYA"]:
-    st.error(f"🚨 PERINGATAN: Kualitas Udara {ai_label}!")
-elif ai_label == "TIDAK SEHAT":
-    st.warning(f"⚠️ PERINGATAN: Kualitas Udara {ai_label}.")
-else:
-    st.success(f"✅ Status Udara: {ai_label}")
-
-# --- ROW 1: PETA & GAUGE ---
-col_map, col_gauge = st.columns([2, 1])
-
-with col_map:
+# --- DASHBOARD LIVE ---
+# Bagian cepat (header, gauge, parameter, tren) dijalankan ulang tiap REFRESH_INTERVAL;
+# peta & tabel rekaman punya fragment sendiri dengan SLOW_REFRESH_INTERVAL.
+# Peta sengaja dipindah ke bawah tren (bukan di samping gauge) agar gauge &
+# parameter tetap satu fragment cepat; fragment peta di kolom sebelah gauge
+# akan memecah bagian cepat menjadi beberapa fragment ber-timer.
+@st.fragment(run_every=REFRESH_INTERVAL)
+def live_dashboard(node):
+    process_queue()
+    data = st.session_state.latest_data
+
+    # --- HEADER ---
+    if data is None:
+        st.info("📡 Menunggu data MQTT... (Pastikan alat menyala)")
+        return
+
+    ai_label = data.ai_label
+    ai_score = data.ai_score
+
+    st.title("🌫️ AirQuality Guard Dashboard")
+    st.markdown(f"**Lokasi:** {node} | **Update:** {to_local_time(data.ts_ns).strftime('%H:%M:%S')}")
+
+    if ai_label in ["SANGAT TIDAK SEHAT", "BERBAHAYA"]:
+        st.error(f"🚨 PERINGATAN: Kualitas Udara {ai_label}!")
+    elif ai_label == "TIDAK SEHAT":
+        st.warning(f"⚠️ PERINGATAN: Kualitas Udara {ai_label}.")
+    else:
+        st.success(f"✅ Status Udara: {ai_label}")
+
+    # --- ROW 1: GAUGE & PARAMETER ---
+    col_gauge, col_param = st.columns([1, 2])
+
+    with col_gauge:
+        st.subheader("📊 AI Confidence")
+        if "fig_gauge" not in st.session_state:
+            st.session_state.fig_gauge = new_gauge_figure()
+        fig_gauge = st.session_state.fig_gauge
+        # Axis, steps & threshold tetap; hanya nilai, warna bar & judul yang berubah
+        fig_gauge.update_traces(
+            value=ai_score * 100,
+            title_text=ai_label,
+            gauge_bar_color=get_gauge_color(ai_score * 100)
+        )
+        st.plotly_chart(fig_gauge, use_container_width=True)
+
+    with col_param:
+        st.subheader("📈 Parameter Udara")
+        tab_lokal, tab_api = st.tabs(["🏠 Sensor Lokal", "☁️ Data API"])
+
+        for tab, metrics in ((tab_lokal, METRICS_LOKAL), (tab_api, METRICS_API)):
+            with tab:
+                for col, (key, label, unit) in zip(st.columns(len(metrics)), metrics):
+                    col.metric(label, f"{getattr(data, key)} {unit}")
+
+    # --- ROW 2: GRAFIK ---
+    st.subheader("📉 Tren Real-time")
+    if "fig_hist" not in st.session_state:
+        st.session_state.fig_hist = new_trend_figure()
+    fig_hist = st.session_state.fig_hist
+
+    # Hanya titik baru sejak render terakhir yang ditambahkan ke trace
+    history = st.session_state.data_history
+    n_new = min(st.session_state.hist_total - st.session_state.last_sent_idx, len(history))
+    if n_new > 0:
+        new_points = list(islice(history, len(history) - n_new, None))
+        new_x = tuple(to_local_time([d.ts_ns for d in new_points]))
+        for trace, key in zip(fig_hist.data, TREND_KEYS):
+            trace.x = (tuple(trace.x) + new_x)[-HISTORY_MAX:]
+            trace.y = (tuple(trace.y) + tuple(getattr(d, key) for d in new_points))[-HISTORY_MAX:]
+        st.session_state.last_sent_idx = st.session_state.hist_total
+
+    if len(history) > 1:
+        st.plotly_chart(fig_hist, use_container_width=True)
+    else:
+        st.info("Menunggu data untuk grafik...")
+
+# --- PETA ---
+@st.fragment(run_every=SLOW_REFRESH_INTERVAL)
+def map_panel():
     st.subheader("📍 Lokasi Real-time")
-    map_data = pd.DataFrame({
-        'lat': [DEFAULT_LAT],
-        'lon': [DEFAULT_LON],
-        'status': [ai_label],
-        'size': [20]
-    })
-    color_map = {"BAIK": "green", "SEDANG": "blue", "TIDAK SEHAT": "orange", "BERBAHAYA": "red"}
-    
-    fig_map = px.scatter_mapbox(
-        map_data, lat="lat", lon="lon", color="status", size="size",
-        color_discrete_map=color_map, zoom=14, height=300
-    )
-    fig_map.update_layout(mapbox_style="open-street-map", margin={"r":0,"t":0,"l":0,"b":0})
+    data = st.session_state.latest_data
+    status = data.ai_label if data is not None else "MENUNGGU"
+    fig_map = build_map(DEFAULT_LAT, DEFAULT_LON, status)
     st.plotly_chart(fig_map, use_container_width=True)
 
-with col_gauge:
-    st.subheader("📊 AI Confidence")
-    fig_gauge = go.Figure(go.Indicator(
-        mode = "gauge+number",
-        value = ai_score * 100,
-        title = {'text': f"{ai_label}"},
-        gauge = {
-            'axis': {'range': [0, 100]},
-            'bar': {'color': get_gauge_color(ai_score * 100)},
-            'steps': [{'range': [0, 100], 'color': "#f0f2f6"}],
-            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 70}
-        }
-    ))
-    fig_gauge.update_layout(height=300, margin=dict(l=20, r=20, t=50, b=20))
-    st.plotly_chart(fig_gauge, use_container_width=True)
-
-# --- ROW 2: PARAMETER ---
-st.subheader("📈 Parameter Udara")
-tab_lokal, tab_api = st.tabs(["🏠 Sensor Lokal", "☁️ Data API"])
-
-with tab_lokal:
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("CO", f"{data.get('co')} mg/m³")
-    c2.metric("PM 2.5", f"{data.get('pm25')} µg/m³")
-    c3.metric("Suhu", f"{data.get('suhu')} °C")
-    c4.metric("Kelembapan", f"{data.get('kelembaban')} %")
-
-with tab_api:
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("NO₂", f"{data.get('no2')} µg/m³")
-    c2.metric("PM 10", f"{data.get('pm10')} µg/m³")
-    c3.metric("SO₂", f"{data.get('so2')} µg/m³")
-    c4.metric("Ozon", f"{data.get('o3')} µg/m³")
-
-# --- ROW 3: GRAFIK ---
-st.subheader("📉 Tren Real-time")
-if len(st.session_state.data_history) > 1:
-    df_hist = pd.DataFrame(st.session_state.data_history)
-    fig_hist = px.line(df_hist, x='timestamp', y=['co', 'pm25', 'no2'], title="Tren Polutan")
-    st.plotly_chart(fig_hist, use_container_width=True)
-else:
-    st.info("Menunggu data untuk grafik...")
-
-# --- ROW 4: TABEL DATA REKAMAN (NEW FEATURE) ---
-st.markdown("---")
-st.subheader("📋 Log Data Rekaman")
-
-if st.session_state.recording_buffer:
-    df_table = pd.DataFrame(st.session_state.recording_buffer)
-    
-    # Konfigurasi Pagination
-    ITEMS_PER_PAGE = 10
-    total_items = len(df_table)
-    total_pages = math.ceil(total_items / ITEMS_PER_PAGE)
+# --- TABEL DATA REKAMAN ---
+@st.fragment(run_every=SLOW_REFRESH_INTERVAL)
+def recording_table():
+    st.markdown("---")
+    st.subheader("📋 Log Data Rekaman")
+
+    if recording_len():
+        # Konfigurasi Pagination
+        ITEMS_PER_PAGE = 10
+        total_items = recording_len()
+        total_pages = math.ceil(total_items / ITEMS_PER_PAGE)
     
-    # Tombol Navigasi
-    col_prev, col_page, col_next = st.columns([1, 2, 1])
+        # Tombol Navigasi
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
     
-    with col_prev:
-        if st.button("⬅️ Sebelumnya"):
-            if st.session_state.table_page > 0:
-                st.session_state.table_page -= 1
-                st.rerun()
+        with col_prev:
+            if st.button("⬅️ Sebelumnya"):
+                if st.session_state.table_page > 0:
+                    st.session_state.table_page -= 1
+                    st.rerun(scope="fragment")
                 
-    with col_next:
-        if st.button("Selanjutnya ➡️"):
-            if st.session_state.table_page < total_pages - 1:
-                st.session_state.table_page += 1
-                st.rerun()
+        with col_next:
+            if st.button("Selanjutnya ➡️"):
+                if st.session_state.table_page < total_pages - 1:
+                    st.session_state.table_page += 1
+                    st.rerun(scope="fragment")
                 
-    with col_page:
-        st.write(f"Halaman **{st.session_state.table_page + 1}** dari **{total_pages}** (Total: {total_items} data)")
-
-    # Slicing Data (Urutan Terbaru di Atas)
-    df_table = df_table.sort_index(ascending=False).reset_index(drop=True)
-    start_idx = st.session_state.table_page * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
+        with col_page:
+            st.write(f"Halaman **{st.session_state.table_page + 1}** dari **{total_pages}** (Total: {total_items} data)")
+
+        # Slicing Data (Urutan Terbaru di Atas)
+        # Potong record array dulu, DataFrame hanya dibuat untuk satu halaman
+        end_idx = total_items - st.session_state.table_page * ITEMS_PER_PAGE
+        start_idx = max(0, end_idx - ITEMS_PER_PAGE)
+        df_page = pd.DataFrame(st.session_state.recording_buffer[start_idx:end_idx][::-1])
+        df_page['session_id'] = st.session_state.session_id
     
-    # Tampilkan Tabel
-    st.dataframe(
-        df_table.iloc[start_idx:end_idx], 
-        use_container_width=True,
-        column_config={
-            "timestamp": "Waktu",
-            "session_id": "ID Sesi"
-        }
-    )
-else:
-    st.info("Belum ada data yang direkam. Klik 'Mulai Rekam' di sidebar untuk mengumpulkan data.")
-
-# Auto Refresh
-time.sleep(2)
-st.rerun()
+        # Tampilkan Tabel
+        st.dataframe(
+            format_records(df_page), 
+            use_container_width=True,
+            column_config={
+                "timestamp": "Waktu",
+                "session_id": "ID Sesi"
+            }
+        )
+    else:
+        st.info("Belum ada data yang direkam. Klik 'Mulai Rekam' di sidebar untuk mengumpulkan data.")
 
+live_dashboard(node)
+map_panel()
+recording_table()